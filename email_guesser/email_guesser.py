@@ -3,26 +3,51 @@
 
 # Based on emailGuesser https://github.com/WhiteHatInspector/emailGuesser
 
-import re, sys
+import re, sys, os
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import time
 import random
-from validate_email_address import validate_email
+import smtplib
+import DNS
 
 try:
-    from Queue import Queue
-except:
+    from Queue import Queue, Empty
+except ImportError:
     import queue as Queue
+    from queue import Empty
 import threading
 from threading import Thread
+from collections import deque
 
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
+try:
+    # Optional, keep answers on disk for an hour so the same guesses are not requested again by the next runs
+    import requests_cache
+    requests_cache.install_cache("osint_cache", expire_after=3600, allowable_codes=(200, 404))
+except ImportError:
+    pass
+
+# One session for every request so connections to skypli, epieos and haveibeenpwned are kept alive and reused
+SESSION = requests.Session()
+adapter = HTTPAdapter(pool_connections=20, pool_maxsize=100, pool_block=False, max_retries=Retry(total=2, backoff_factor=0.3))
+SESSION.mount("https://", adapter)
+SESSION.mount("http://", adapter)
+SESSION.headers.update({"Connection": "keep-alive", "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0"})
+# (connect, read) timeouts in seconds, a stalled host would otherwise block a worker forever
+TIMEOUT = (3.05, 10)
+# Answers meaning the page can't be used (missing, forbidden or rate limited)
+SKIP_STATUSES = frozenset({404, 403, 401, 429})
+# Bytes kept after the looked for element when parsing only the head of a page
+PEEK_SIZE = 16384
+
 try:
     enclosure_queue = Queue()
-except:
+except TypeError:
     enclosure_queue = Queue.Queue()
 
 # Colours to be added in text output to make it more readable and user-friendly
@@ -35,111 +60,241 @@ reset = "\033[39m"
 # User input about all domains to be searched
 domain = ["gmail.com", "hotmail.com", "orange.fr", "yopmail.com", "protonmail.com"] #"yahoo.com", "free.fr" dosn't seem work
 
+# Email username templates: {first} first name, {last} last name, {f} and {l} their first letter,
+# {p} pseudo, {k} keyword, {b} birth year and {b2} its last two digits
+TEMPLATES = ["{f}{last}", "{f}.{last}", "{f}_{last}", "{last}{f}", "{last}.{f}", "{last}_{f}", "{l}{first}", "{l}.{first}", "{l}_{first}", "{first}{l}", "{first}.{l}", "{first}_{l}", "{last}{first}", "{last}.{first}", "{last}_{first}", "{first}{last}", "{first}.{last}", "{first}_{last}", "{first}{last}1", "{first}{last}.1", "{f}{last}1", "{f}{last}.1", "{first}.{last}1", "{first}.{last}.1"]
+BIRTH_BASES = ["{last}{first}", "{first}{last}", "{f}{last}", "{f}.{last}", "{f}_{last}", "{first}.{l}", "{first}_{l}", "{last}.{first}", "{first}.{last}", "{last}_{first}", "{first}_{last}"]
+BIRTH_TEMPLATES = [base + suffix for suffix in ["{b}", "{b2}", ".{b}", "_{b}", ".{b2}", "_{b2}"] for base in BIRTH_BASES]
+IDENTITY_BASES = ["{last}{first}", "{first}{last}", "{f}{last}", "{f}.{last}", "{f}_{last}", "{first}.{l}", "{first}_{l}"]
+PSEUDO_TEMPLATES = [base + "{p}" for base in IDENTITY_BASES]
+KEYWORD_TEMPLATES = [base + "{k}" for base in IDENTITY_BASES]
+
+# Regexes used for every guessed email, compiled once
+# Simple Regex for syntax checking
+EMAIL_RE = re.compile(r'^[_a-z0-9-]+(\.[_a-z0-9-]+)*@[a-z0-9-]+(\.[a-z0-9-]+)*(\.[a-z]{2,})$')
+AVATAR_RE = re.compile("avatar.skype.com")
+# Breach count on the haveibeenpwned account page, searched in the raw page without building a tree
+PWNCOUNT_RE = re.compile(rb'id="pwnCount"[^>]*>([^<]*)<')
+
 # Lists with which we will work during the script
 emails = []
 emails_for_verification = []
-final_emails = []
-final_emails_text = []
-
-def check_haveibeenpwnd(mailcheck, requestPwnedStartTimer):
-    # Count time elapsed since last haveIbeenPwned iteration/check
-    requestPwnedEndTimer = time.perf_counter()
-    requestPwnedTimePassed = requestPwnedEndTimer - requestPwnedStartTimer
-
-    # Add a random delay between 7 and 11 seconds to not let your IP get banned
-    randomTimePassed = random.randint(7, 11)
-    if requestPwnedTimePassed < randomTimePassed:
-        time.sleep(randomTimePassed - requestPwnedTimePassed)
-
-    url = "https://haveibeenpwned.com/account/" + mailcheck
-    page = requests.get(url, verify=False)
-    if page.status_code not in [404, 403, 401, 429]:
-        soup = BeautifulSoup(page.content, 'html.parser')
-        results = soup.find_all(id="pwnCount")  # class_='pwnTitle'
-        # print(results)
+# Skype hits are pushed on the left to be shown first, deque appends are O(1) and thread-safe
+final_emails = deque()
+final_emails_text = deque()
+# Emails accepted by their mail server, written to the output file then checked on skype and haveibeenpwned
+existing_emails = deque()
+
+# Number of workers checking guessed emails at the same time
+threads = 50
+
+# Only haveibeenpwned needs throttling, so it gets its own lock and timer: skype checks keep running in the other workers
+hibp_lock = threading.Lock()
+requestPwnedStartTimer = 0
+
+# haveibeenpwned API key (https://haveibeenpwned.com/API/Key), without it the website is scraped
+hibp_api_key = os.environ.get("HIBP_API_KEY")
+# Seconds between two API calls, the website needs a random delay between 7 and 11 seconds instead
+hibp_api_delay = 1.5
+
+
+class HibpAdapter(HTTPAdapter):
+    # The delay is applied here and not before the call: an answer from requests_cache never reaches the adapter, so it doesn't wait
+    def send(self, request, **kwargs):
+        global requestPwnedStartTimer
+        # Count time elapsed since last haveIbeenPwned iteration/check
+        requestPwnedTimePassed = time.perf_counter() - requestPwnedStartTimer
+
+        # Add a delay to not let your IP get banned
+        randomTimePassed = hibp_api_delay if hibp_api_key else random.randint(7, 11)
+        if requestPwnedTimePassed < randomTimePassed:
+            time.sleep(randomTimePassed - requestPwnedTimePassed)
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            # Restart timer
+            requestPwnedStartTimer = time.perf_counter()
+
+
+SESSION.mount("https://haveibeenpwned.com/", HibpAdapter(max_retries=Retry(total=2, backoff_factor=0.3)))
+
+
+def check_haveibeenpwnd(mailcheck):
+    with hibp_lock:
+        if hibp_api_key:
+            url = "https://haveibeenpwned.com/api/v3/breachedaccount/" + mailcheck
+            page = SESSION.get(url, headers={"hibp-api-key": hibp_api_key}, params={"truncateResponse": "true"}, verify=False, timeout=TIMEOUT)
+            if page.status_code == 429:
+                # Rate limited anyway, wait the time asked by the API then retry once
+                time.sleep(int(page.headers.get("retry-after", 2)))
+                page = SESSION.get(url, headers={"hibp-api-key": hibp_api_key}, params={"truncateResponse": "true"}, verify=False, timeout=TIMEOUT)
+        else:
+            url = "https://haveibeenpwned.com/account/" + mailcheck
+            page = SESSION.get(url, verify=False, timeout=TIMEOUT)
+
+    pwned = False
+    if hibp_api_key:
+        # 200 with the list of breaches, 404 if the account is not pwned
+        if page.status_code in (401, 403):
+            print(yellow + " haveibeenpwned refused the API key ({}), {} not checked".format(page.status_code, mailcheck) + reset)
+        elif page.status_code == 200:
+            try:
+                pwned = len(page.json()) > 0
+            except ValueError:
+                pass
+    elif page.status_code not in SKIP_STATUSES:
+        pwn_count = PWNCOUNT_RE.search(page.content)
+        pwned = pwn_count is not None and b"Not pwned" not in pwn_count.group(1)
+    if pwned:
+        print(red + mailcheck + reset + " was found to be " + red + "Pwned!" + reset)
+        final_emails_text.append(mailcheck)
+        final_emails.append(red + mailcheck + reset + "\n") # Add it to the bottom of the list as breached with no additional details
+
+
+def preconnect():
+    # Open the connection to skypli while the mail servers are checked, so the first lookup doesn't pay the TLS handshake
+    try:
+        SESSION.head("https://www.skypli.com/", verify=False, timeout=5)
+    except requests.RequestException:
+        pass
+
+
+def smtp_check_domain(dom, candidates):
+    # Resolve the MX servers once for the whole domain, mxlookup keeps the answer order so sort them by preference
+    try:
+        mx_hosts = [host for preference, host in sorted(DNS.mxlookup(dom))]
+    except (DNS.DNSError, IndexError, OSError):
+        return
+    # One SMTP conversation per domain: RCPT TO every candidate on the same connection
+    checked = 0
+    for mx in mx_hosts:
+        try:
+            with smtplib.SMTP(mx, timeout=TIMEOUT[1]) as smtp:
+                code, message = smtp.helo()
+                if code != 250:
+                    continue
+                smtp.mail("")
+                while checked < len(candidates):
+                    email = candidates[checked]
+                    code, message = smtp.rcpt(email)
+                    if 400 <= code < 500:
+                        # Temporary refusal (e.g. 452 too many recipients), the next MX server checks the rest
+                        break
+                    if code == 250:
+                        print("\033[32m \u251c {}\033[0m exist".format(email))
+                        existing_emails.append(email)
+                    checked += 1
+        except (smtplib.SMTPException, OSError):
+            # Connection lost, the emails already accepted are kept and the next MX server checks the rest
+            pass
+        if checked == len(candidates):
+            return
+
+
+def page_head(content, marker):
+    # Cut the page a little after marker, the element we look for is near it and the rest doesn't need to be parsed
+    found = content.find(marker)
+    return content if found == -1 else content[:found + PEEK_SIZE]
+
+
+def check_email(email):
+    url = "https://www.skypli.com/search/" + email
+    try:
+        page = SESSION.get(url, verify=False, timeout=TIMEOUT)
+    except (requests.Timeout, requests.ConnectionError):
+        # No answer from skypli, handled like the error 500 below
+        page = None
+    # If an e-mail was found registered to only one user in Skype, print his details
+    # Else if found registered to multiple users, show link to the tool user to decide if he wants to see more info
+    # Else if found on breached database, return that the e-mail address is found to be Pwned
+    # Else, return that the e-mail was not found to be pwned (does not exist)
+    if page is not None and page.status_code != 500: 
+        soup = BeautifulSoup(page_head(page.content, b"search-results__block-info-username"), "lxml")
+        results = soup.find_all(class_="search-results__title")
         for n in results:
-            if n.text.strip() != "Not pwned in any data breaches and found no pastes (subscribe to search sensitive breaches)":
-                print(red + mailcheck + reset + " was found to be " + red + "Pwned!" + reset)
-                final_emails_text.append(mailcheck)
-                final_emails.append(red + mailcheck + reset + "\n") # Add it to the bottom of the list as breached with no additional details
+            txt = n.text.strip()
+            if txt == "1 results for " + email:
+                final_emails_text.appendleft(email)
+                print(blue + "  \u251c" + email + reset + " was found in Skype")
+                result = soup.find(class_="search-results__block-info-username")
+                url_new = "https://www.skypli.com/profile/" + result.text.strip()
+                try:
+                    page_new = SESSION.get(url_new, verify=False, timeout=TIMEOUT)
+                except (requests.Timeout, requests.ConnectionError):
+                    # Profile page not reachable, keep the hit with its link only
+                    final_emails.appendleft(blue + email + reset + "\nMore info: " + url_new + "\n")
+                    continue
+                soup_new = BeautifulSoup(page_new.content, "lxml")
+                details = blue + email + reset
+                result_new = soup_new.find_all(class_="profile-box__table-value")
+                for r in result_new:
+                    details = details + "\n" + r.text.strip()
+                final_emails.appendleft(details + "\nMore info: " + url_new + "\n") # Add it to the top of the list in order to be shown first as Skype account
+            elif txt != "0 results for " + email:
+                final_emails_text.appendleft(email)
+                print(blue + " \u251c " + email + reset + " was found in multiple Skype accounts")
+                final_emails.appendleft(blue + email + reset + " Multiple skype accounts found: " + url) # Add it to the top of the list in order to be shown first as Skype account
     else:
-        # Restart timer
-        requestPwnedStartTimer = time.perf_counter()
-
-
-def email_validation(i, q, requestPwnedStartTimer, s):
-    for n in range(len_mails):
-        email = q.get()
-        is_valid = validate_email(email, verify=True)
-        if is_valid:
-            print("\033[32m \u251c {}\033[0m exist".format(email))
-            with open("{}.txt".format(sys.argv[2]), "a+") as write_email:
-                write_email.write(email+"\n")
-            url = "https://www.skypli.com/search/" + email
-            page = requests.get(url, verify=False)
-            # If an e-mail was found registered to only one user in Skype, print his details
-            # Else if found registered to multiple users, show link to the tool user to decide if he wants to see more info
-            # Else if found on breached database, return that the e-mail address is found to be Pwned
-            # Else, return that the e-mail was not found to be pwned (does not exist)
-            if page.status_code != 500: 
-                soup = BeautifulSoup(page.content, "html.parser")
-                results = soup.find_all(class_="search-results__title")
-                for n in results:
-                    if n.text.strip() == "1 results for " + email:
-                        final_emails_text.insert(0, email)
-                        print(blue + "  \u251c" + email + reset + " was found in Skype")
-                        result = soup.find(class_="search-results__block-info-username")
-                        url_new = "https://www.skypli.com/profile/" + result.text.strip()
-                        page_new = s.get(url_new, verify=False)
-                        soup_new = BeautifulSoup(page_new.content, "html.parser")
-                        email = blue + email + reset
-                        result_new = soup_new.find_all(class_="profile-box__table-value")
-                        for r in result_new:
-                            email = email + "\n" + r.text.strip()
-                        final_emails.insert(0, email + "\nMore info: " + url_new + "\n") # Add it to the top of the list in order to be shown first as Skype account
-                    elif n.text.strip() != "0 results for " + email:
-                        final_emails_text.insert(0, email)
-                        print(blue + " \u251c " + email + reset + " was found in multiple Skype accounts")
-                        final_emails.insert(0, blue + email + reset + " Multiple skype accounts found: " + url) # Add it to the top of the list in order to be shown first as Skype account
-                    else:
-                        check_haveibeenpwnd(email, requestPwnedStartTimer)
-            else:
-                # If skypli.com is down (error 500), use tools.epieos.com/skype.php
-                url = "https://tools.epieos.com/skype.php"
-                my_data = {"data": email}
-                page = s.post(url, data=my_data, verify=False)
-                if page.status_code not in [404, 403, 401]:
-                    soup = BeautifulSoup(page.content, "html.parser")
-                    results = soup.find_all(class_="col-md-4 offset-md-4 mt-5 pt-3 border")
-                    avatars = soup.find_all(src=re.compile("avatar.skype.com"))
+        # If skypli.com is down (error 500 or no answer), use tools.epieos.com/skype.php
+        url = "https://tools.epieos.com/skype.php"
+        my_data = {"data": email}
+        try:
+            page = SESSION.post(url, data=my_data, verify=False, timeout=TIMEOUT)
+        except (requests.Timeout, requests.ConnectionError):
+            page = None
+        if page is not None and page.status_code not in SKIP_STATUSES:
+            soup = BeautifulSoup(page.content, "lxml")
+            results = soup.find_all(class_="col-md-4 offset-md-4 mt-5 pt-3 border")
+            avatars = soup.find_all(src=AVATAR_RE)
+            for n in results:
+                txt = n.text.strip()
+                if len(results) == 1 and "No skype account" not in txt:
+                    final_emails_text.appendleft(email)
+                    print(blue + " \u251c " + email + reset + " was found in Skype")
+                    find_name = txt.find("Name : ")
+                    find_skype_id = txt.find("Skype Id : ")
+                    end_text = txt.rfind("</p>")
+                    avatar = soup.find(src=AVATAR_RE)
+                    details = blue + email + reset + "\n" + txt[find_name:find_skype_id] + "\n" + txt[find_skype_id:end_text] + "\nAvatar : " + blue + str(avatar["src"]) + reset
+                    final_emails.appendleft(details + "\n") # Add it to the top of the list in order to be shown first as Skype account
+                elif len(results) > 1:
+                    final_emails_text.appendleft(email)
+                    print(blue + " \u251c " + email + reset + " was found in multiple Skype accounts")
+                    details = blue + email + reset + " --> Multiple skype accounts found: \n"
                     for n in results:
-                        if len(results) == 1 and "No skype account" not in n.text.strip():
-                            final_emails_text.insert(0, email)
-                            print(blue + " \u251c " + email + reset + " was found in Skype")
-                            find_name = n.text.strip().find("Name : ")
-                            find_skype_id = n.text.strip().find("Skype Id : ")
-                            end_text = n.text.strip().rfind("</p>")
-                            avatar = soup.find(src=re.compile("avatar.skype.com"))
-                            email = blue + email + reset + "\n" + n.text.strip()[find_name:find_skype_id] + "\n" + n.text.strip()[find_skype_id:end_text] + "\nAvatar : " + blue + str(avatar["src"]) + reset
-                            final_emails.insert(0, email + "\n") # Add it to the top of the list in order to be shown first as Skype account
-                        elif len(results) > 1:
-                            final_emails_text.insert(0, email)
-                            print(blue + " \u251c " + email + reset + " was found in multiple Skype accounts")
-                            email = blue + email + reset + " --> Multiple skype accounts found: \n"
-                            for n in results:
-                                find_name = n.text.strip().find("Name : ")
-                                find_skype_id = n.text.strip().find("Skype Id : ")
-                                end_text = n.text.strip().rfind("</p>")
-                                email += n.text.strip()[find_name:find_skype_id] + "\n" + n.text.strip()[find_skype_id:end_text] + "\n"
-                            final_emails.insert(0, email + "\n")  # Add it to the top of the list in order to be shown first as Skype account
-                            break
-                        else:
-                            check_haveibeenpwnd(email, requestPwnedStartTimer)
-                else:
-                    #print("https://tools.epieos.com/skype.php not available")
-                    check_haveibeenpwnd(email, requestPwnedStartTimer)
-            check_haveibeenpwnd(email, requestPwnedStartTimer)
-        q.task_done()
+                        txt = n.text.strip()
+                        find_name = txt.find("Name : ")
+                        find_skype_id = txt.find("Skype Id : ")
+                        end_text = txt.rfind("</p>")
+                        details += txt[find_name:find_skype_id] + "\n" + txt[find_skype_id:end_text] + "\n"
+                    final_emails.appendleft(details + "\n")  # Add it to the top of the list in order to be shown first as Skype account
+                    break
+    # Every address is checked once on haveibeenpwned, each call waits for the delay
+    check_haveibeenpwnd(email)
+
+
+def write_found_emails(output_name):
+    # copy() is atomic, the SMTP workers may still be appending when interrupted
+    found_emails = existing_emails.copy()
+    if found_emails:
+        with open("{}.txt".format(output_name), "ab") as write_email:
+            write_email.write(("\n".join(found_emails) + "\n").encode())
+
+
+def email_validation(i, q):
+    # Every email is queued before the workers start, so an empty queue means the work is done
+    while True:
+        try:
+            email = q.get_nowait()
+        except Empty:
+            return
+        try:
+            check_email(email)
+        except (requests.RequestException, AttributeError, TypeError, IndexError, ValueError):
+            # Host error or unexpected page (e.g. epieos hit without avatar), skip this email and keep the worker alive
+            pass
+        finally:
+            q.task_done()
 
 
 # User inputs
@@ -151,144 +306,55 @@ def emails_guess(firstname, lastname, pseudo, birth_year, keyword):
     username_input = pseudo
     keyword = keyword
     skype_input = "y"
+    # Found emails are saved in <identity>.txt, or <pseudo>.txt without identity
+    output_name = identity if identity else username_input
+
+    # Values put in the templates, the identity ones only if specified by the user
+    values = {"p": username_input, "k": keyword, "b": birth_input, "b2": birth_input[2:] if birth_input else None}
+    if identity:
+        values.update({"first": name_input, "last": last_name_input, "f": name_input[0], "l": last_name_input[0]})
+
+    structure = list(TEMPLATES)
+
+    # Add formats using birth year if specified by the user
+    if birth_input:
+        structure += BIRTH_TEMPLATES
+
+    # Add username format if specified by the user
+    if username_input or keyword:
+        if username_input and not keyword:
+            structure.append("{p}")
+            if username_input and identity:
+                structure += PSEUDO_TEMPLATES
+        elif username_input and keyword:
+            structure += ["{p}", "{p}{k}", "{k}{p}"]
+        # add birth date to usernames only if specified by user
+        elif username_input and birth_input:
+            structure += ["{p}{b}", "{p}{b2}", "{p}.{b}", "{p}_{b}", "{p}.{b2}", "{p}_{b2}"]
+        else:
+            structure += KEYWORD_TEMPLATES
 
-    s = requests.session()
-
-    global len_mails
-    len_mails = 0
+    # Fill every template in one pass, the ones needing the identity are skipped when it was not given
+    usernames = []
+    for x in structure:
+        try:
+            usernames.append(x.format_map(values))
+        except KeyError:
+            pass
 
-    # for every domain specified by user, make combinations and add them to the list
+    # for every domain specified by user, add the combinations to the list
     for dom in domain:
-        structure = ["f!!last!!", "f!!.last!!", "f!!_last!!", "last!!f!!", "last!!.f!!", "last!!_f!!", "l!!first!!", "l!!.first!!", "l!!_first!!", "first!!l!!", "first!!.l!!", "first!!_l!!", "last!!first!!", "last!!.first!!", "last!!_first!!", "first!!last!!", "first!!.last!!", "first!!_last!!", "first!!last!!1", "first!!last!!.1", "f!!last!!1", "f!!last!!.1", "first!!.last!!1", "first!!.last!!.1"]
-
-        # Add formats using birth year if specified by the user
-        if birth_input:
-            structure.append("last!!first!!" + birth_input)
-            structure.append("first!!last!!" + birth_input)
-            structure.append("f!!last!!" + birth_input)
-            structure.append("f!!.last!!" + birth_input)
-            structure.append("f!!_last!!" + birth_input)
-            structure.append("first!!.l!!" + birth_input)
-            structure.append("first!!_l!!" + birth_input)
-            structure.append("last!!.first!!" + birth_input)
-            structure.append("first!!.last!!" + birth_input)
-            structure.append("last!!_first!!" + birth_input)
-            structure.append("first!!_last!!" + birth_input)
-            structure.append("last!!first!!" + birth_input[2:])
-            structure.append("first!!last!!" + birth_input[2:])
-            structure.append("f!!last!!" + birth_input[2:])
-            structure.append("f!!.last!!" + birth_input[2:])
-            structure.append("f!!_last!!" + birth_input[2:])
-            structure.append("first!!.l!!" + birth_input[2:])
-            structure.append("first!!_l!!" + birth_input[2:])
-            structure.append("last!!.first!!" + birth_input[2:])
-            structure.append("first!!.last!!" + birth_input[2:])
-            structure.append("last!!_first!!" + birth_input[2:])
-            structure.append("first!!_last!!" + birth_input[2:])
-            structure.append("last!!first!!." + birth_input)
-            structure.append("first!!last!!." + birth_input)
-            structure.append("f!!last!!." + birth_input)
-            structure.append("f!!.last!!." + birth_input)
-            structure.append("f!!_last!!." + birth_input)
-            structure.append("first!!.l!!." + birth_input)
-            structure.append("first!!_l!!." + birth_input)
-            structure.append("last!!.first!!." + birth_input)
-            structure.append("first!!.last!!." + birth_input)
-            structure.append("last!!_first!!." + birth_input)
-            structure.append("first!!_last!!." + birth_input)
-            structure.append("last!!first!!_" + birth_input)
-            structure.append("first!!last!!_" + birth_input)
-            structure.append("f!!last!!_" + birth_input)
-            structure.append("f!!.last!!_" + birth_input)
-            structure.append("f!!_last!!_" + birth_input)
-            structure.append("first!!.l!!_" + birth_input)
-            structure.append("first!!_l!!_" + birth_input)
-            structure.append("last!!.first!!_" + birth_input)
-            structure.append("first!!.last!!_" + birth_input)
-            structure.append("last!!_first!!_" + birth_input)
-            structure.append("first!!_last!!_" + birth_input)
-            structure.append("last!!first!!." + birth_input[2:])
-            structure.append("first!!last!!." + birth_input[2:])
-            structure.append("f!!last!!." + birth_input[2:])
-            structure.append("f!!.last!!." + birth_input[2:])
-            structure.append("f!!_last!!." + birth_input[2:])
-            structure.append("first!!.l!!." + birth_input[2:])
-            structure.append("first!!_l!!." + birth_input[2:])
-            structure.append("last!!.first!!." + birth_input[2:])
-            structure.append("first!!.last!!." + birth_input[2:])
-            structure.append("last!!_first!!." + birth_input[2:])
-            structure.append("first!!_last!!." + birth_input[2:])
-            structure.append("last!!first!!_" + birth_input[2:])
-            structure.append("first!!last!!_" + birth_input[2:])
-            structure.append("f!!last!!_" + birth_input[2:])
-            structure.append("f!!.last!!_" + birth_input[2:])
-            structure.append("f!!_last!!_" + birth_input[2:])
-            structure.append("first!!.l!!_" + birth_input[2:])
-            structure.append("first!!_l!!_" + birth_input[2:])
-            structure.append("last!!.first!!_" + birth_input[2:])
-            structure.append("first!!.last!!_" + birth_input[2:])
-            structure.append("last!!_first!!_" + birth_input[2:])
-            structure.append("first!!_last!!_" + birth_input[2:])
-
-        # Add username format if specified by the user
-        if username_input or keyword:
-            if username_input and not keyword:
-                structure.append(username_input)
-                if username_input and identity:
-                    structure.append("last!!first!!" + username_input)
-                    structure.append("first!!last!!" + username_input)
-                    structure.append("f!!last!!" + username_input)
-                    structure.append("f!!.last!!" + username_input)
-                    structure.append("f!!_last!!" + username_input)
-                    structure.append("first!!.l!!" + username_input)
-                    structure.append("first!!_l!!" + username_input)
-            elif username_input and keyword:
-                structure.append(username_input)
-                structure.append(username_input + keyword)
-                structure.append(keyword + username_input)
-                        # add birth date to usernames only if specified by user
-            elif username_input and birth_input:
-                structure.append(username_input + birth_input)
-                structure.append(username_input + birth_input[2:])
-                structure.append(username_input + "." + birth_input)
-                structure.append(username_input + "_" + birth_input)
-                structure.append(username_input + "." + birth_input[2:])
-                structure.append(username_input + "_" + birth_input[2:])
-            else:
-                structure.append("last!!first!!" + keyword)
-                structure.append("first!!last!!" + keyword)
-                structure.append("f!!last!!" + keyword)
-                structure.append("f!!.last!!" + keyword)
-                structure.append("f!!_last!!" + keyword)
-                structure.append("first!!.l!!" + keyword)
-                structure.append("first!!_l!!" + keyword)
-
-        # Switch f!! with first letter of name, l!! with first letter of surname, first!! with first name and last!! with surname
-        found_first = False
-        found_last = False
-        for x in structure:
-            if identity:
-                if x.find("first!!") != -1:
-                    x = x.replace("first!!", name_input)
-                    found_first = True
-                if x.find("last!!") != -1:
-                    x = x.replace("last!!", last_name_input)
-                    found_last = True
-                if x.find("f!!") != -1:
-                    x = x.replace("f!!", name_input[0])
-                if x.find("l!!") != -1:
-                    x = x.replace("l!!", last_name_input[0])
-            emails.append(x + "@" + dom)
-
-
-    # Simple Regex for syntax checking
-    regex = '^[_a-z0-9-]+(\.[_a-z0-9-]+)*@[a-z0-9-]+(\.[a-z0-9-]+)*(\.[a-z]{2,})$'
+        for username in usernames:
+            emails.append(username + "@" + dom)
+
+    # Several templates can give the same email (e.g. pseudo equal to the first name), check each one only once
+    emails[:] = dict.fromkeys(emails)
 
     # Email addresses verification (Bulk syntax checking)
     for n in emails:
 
         # Syntax check
-        match = re.match(regex, n)
+        match = EMAIL_RE.match(n)
         if match != None:
             if "gmail" in n and "_" in n or "." in n.split("@")[0]:
                 pass
@@ -298,40 +364,50 @@ def emails_guess(firstname, lastname, pseudo, birth_year, keyword):
 
     # check Skypli for speed then check haveibeenpwned if not found on skype
     if len(emails_for_verification) != 0:
-        # Initialize request timer for first iteration of beenPwned
-        requestPwnedStartTimer = 0
-
-        for n in emails_for_verification:
-            len_mails += 1
-
-        #print(len_mails)
-        #print(emails_for_verification)
-
+        emails_written = False
+        started = 0
         try:
-            #print(emails_for_verification)
+            Thread(target=preconnect, daemon=True).start()
+            # Group the emails by domain so each mail server is resolved and contacted only once
+            by_domain = {}
             for efv in emails_for_verification:
+                by_domain.setdefault(efv.split("@", 1)[1], []).append(efv)
+            smtp_workers = [Thread(target=smtp_check_domain, args=(dom, candidates), daemon=True) for dom, candidates in by_domain.items()]
+            for worker in smtp_workers:
+                worker.start()
+            for worker in smtp_workers:
+                worker.join()
+            # Every existing email is known now, save them before the slow haveibeenpwned checks
+            write_found_emails(output_name)
+            emails_written = True
+
+            for efv in existing_emails:
                 enclosure_queue.put(efv)
-            for i in range(10):
-                worker = Thread(target=email_validation, args=(i, enclosure_queue, requestPwnedStartTimer, s))
+            for i in range(threads):
+                worker = Thread(target=email_validation, args=(i, enclosure_queue))
                 worker.setDaemon(True)
-                worker.start()
-            enclosure_queue.join()
+                try:
+                    worker.start()
+                except RuntimeError:
+                    # Can't start as many threads as asked, the ones already started drain the queue
+                    break
+                started += 1
+            if started:
+                enclosure_queue.join()
+            else:
+                print(red + " Can't start any thread, e-mails not checked on Skype and haveibeenpwned" + reset)
         except KeyboardInterrupt:
             print(" Canceled by keyboard interrupt (Ctrl-C)")
+            if not emails_written:
+                write_found_emails(output_name)
             sys.exit()
-        except Exception:
-            pass
-            #traceback.print_exc()
 
 
     if len(final_emails) != 0:
-        # Show user all e-mails that were found on skype or pwned
-        print("")
-        print("-------------------------------------")
-        print("")
-        print("Emails found:\n")
-        for finalEmail in final_emails:
-            print(finalEmail)
+        # Show user all e-mails that were found on skype or pwned, built first then written at once
+        report = ["", "-------------------------------------", "", "Emails found:\n"]
+        report.extend(final_emails)
+        sys.stdout.write("\n".join(report) + "\n")
     else:
         print(red + "No e-mails leaking found " + reset)
 
@@ -342,12 +418,16 @@ def emails_guess(firstname, lastname, pseudo, birth_year, keyword):
         print("Searching Skype users...")
         url = "https://www.skypli.com/search/{}%20{}".format(name_input, last_name_input) if identity else "https://www.skypli.com/search/{}".format(username_input) 
         print(url)
-        page = s.get(url, verify=False)
-        soup = BeautifulSoup(page.content, "html.parser")
-        results = soup.find(class_="search-results__title")
-        if page.status_code != 500:
-            if results.text.strip() != "0 results for " + name_input + " " + last_name_input:
-                print(results.text.strip() + ". Autocompleting list of e-mail usernames...")
+        try:
+            page = SESSION.get(url, verify=False, timeout=TIMEOUT)
+        except (requests.Timeout, requests.ConnectionError):
+            page = None
+        if page is not None and page.status_code != 500:
+            soup = BeautifulSoup(page.content, "lxml")
+            results = soup.find(class_="search-results__title")
+            txt = results.text.strip()
+            if txt != "0 results for " + name_input + " " + last_name_input:
+                print(txt + ". Autocompleting list of e-mail usernames...")
                 results = soup.find_all(class_="search-results__block-info-username")
                 for n in results:
                     test_text = n.text.strip()
@@ -366,11 +446,15 @@ def emails_guess(firstname, lastname, pseudo, birth_year, keyword):
             else:
                 print("No results on Skype for this name!")
         else:
-            # If skypli.com is down (error 500), use tools.epieos.com/skype.php
+            # If skypli.com is down (error 500 or no answer), use tools.epieos.com/skype.php
             url = "https://tools.epieos.com/skype.php"
             my_data = {"data": name_input + " " + last_name_input} if identity else {"data": username_input}
-            page = s.post(url, data=my_data, verify=False)
-            soup = BeautifulSoup(page.content, "html.parser")
+            try:
+                page = SESSION.post(url, data=my_data, verify=False, timeout=TIMEOUT)
+            except (requests.Timeout, requests.ConnectionError):
+                print(red + "Skype search not available" + reset)
+                return
+            soup = BeautifulSoup(page.content, "lxml")
             results = soup.find_all(class_="col-md-4 offset-md-4 mt-5 pt-3 border")
             check_results = soup.find(class_="col-md-4 offset-md-4 mt-5 pt-3 border")
             if len(results) >= 1 and "No skype account" not in check_results.text.strip():
@@ -408,9 +492,14 @@ if __name__ == '__main__':
     group = parser.add_argument_group('\033[34m> Assistance\033[0m')
     group.add_argument("-b", help="birth year, exemple: -b 1999 (yeah my birth year)", dest='birth_year', required=False)
     group.add_argument("-k", help="Keyword, the script will be based on this, exemple: -k security; -k pro", dest='keyword', required=False)
+    group.add_argument("-t", help="Number of threads, default: 50", dest='thread', type=int, default=50, required=False)
+    group.add_argument("-a", help="haveibeenpwned API key, use the API instead of scraping the website (default: $HIBP_API_KEY)", dest='api_key', default=os.environ.get("HIBP_API_KEY"), required=False)
 
     results = parser.parse_args()
 
+    if results.thread < 1:
+        parser.error("-t needs at least 1 thread")
+
     if len(sys.argv) < 2:
         print("\nOption missing\n")
         parser.print_help()
@@ -420,6 +509,8 @@ if __name__ == '__main__':
     pseudo = results.pseudo
     birth_year = results.birth_year
     keyword = results.keyword
+    threads = results.thread
+    hibp_api_key = results.api_key
 
     firstname = identity.split("_")[0] if identity else None
     lastname = identity.split("_")[1] if identity else None
@@ -1,22 +1,72 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys
+import re, sys
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import traceback
+import functools
+from queue import Queue, Empty
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 
 
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
-
+try:
+    # Optional, keep answers on disk for an hour so the same guesses are not requested again by the next runs
+    import requests_cache
+    requests_cache.install_cache("osint_cache", expire_after=3600, allowable_codes=(200, 404))
+except ImportError:
+    pass
+
+# One session for every request so connections to snapchat and geofree are kept alive and reused
+SESSION = requests.Session()
+adapter = HTTPAdapter(pool_connections=20, pool_maxsize=100, pool_block=False, max_retries=Retry(total=2, backoff_factor=0.3))
+SESSION.mount("https://", adapter)
+SESSION.mount("http://", adapter)
+SESSION.headers.update({"Connection": "keep-alive", "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/115.0"})
+# (connect, read) timeouts in seconds, a stalled host would otherwise block a worker forever
+TIMEOUT = (3.05, 10)
+# Answers meaning the page can't be used (missing, forbidden or rate limited)
+SKIP_STATUSES = frozenset({404, 403, 401, 429})
+# Bytes kept after the looked for element when parsing only the head of a page
+PEEK_SIZE = 16384
+
+# Class of the real name on a snapchat profile page, compiled once
+NAME_RE = re.compile(r'UserDetailsCard_title*')
+
+# Username patterns: {e} the base username, {c} the city, {z} its postal code and {k} the keyword
+CITY_PATTERNS = [
+    "{e}{c}", "{c}{e}", "{e}_{c}", "{e}.{c}",
+    "{e}_de{c}", "{e}_of{c}",
+    "{e}-de{c}", "{e}-of{c}",
+    "{e}{z}", "{z}{e}", "{e}_{z}",
+    "{e}_du{z}", "{e}_of{z}",
+    "{e}-du{z}", "{e}-of{z}"]
+KEYWORD_PATTERNS = ["{e}{k}", "{k}{e}", "{e}_{k}", "{e}-{k}", "{e}.{k}"]
+KEYWORD_IDENTITY_PATTERNS = [
+    "{e}{k}", "{k}{e}", "{e}_{k}", "{e}.{k}",
+    "{e}_de{k}", "{e}_of{k}",
+    "{e}-de{k}", "{e}-of{k}"]
+
+# Number of usernames checked at the same time, kept low to stay polite with snapchat
+threads = 20
+
+
+@functools.lru_cache(maxsize=1024)
 def get_postal_code(city):
     url_geocode = "http://geofree.fr/gf/zipfinder.asp"
     datas = {"todo": "2", "runok": "1", "isdom": "0", "town": "{}".format(city), "deptnb": '', "rgroup1": ''}
-    req_geo = requests.post(url_geocode, data=datas, verify=False)
-    soup = BeautifulSoup(req_geo.text, "html.parser")
+    try:
+        req_geo = SESSION.post(url_geocode, data=datas, verify=False, timeout=TIMEOUT)
+    except (requests.Timeout, requests.ConnectionError):
+        return "00"
+    soup = BeautifulSoup(req_geo.text, "lxml")
     find_geocode = soup.find("td", {"bgcolor":"#CCCCCC"})
     if find_geocode and not "exactement" in find_geocode:
         geo_code = find_geocode.text.split(":")[1].strip()
@@ -26,27 +76,60 @@ def get_postal_code(city):
 
 
 
-def get_snapchat(endpoint, s):
+def page_head(content, marker):
+    # Cut the page a little after marker, the element we look for is near it and the rest doesn't need to be parsed
+    found = content.find(marker)
+    return content if found == -1 else content[:found + PEEK_SIZE]
+
+
+def get_snapchat(endpoint):
     url_snapchat = "https://www.snapchat.com/add/{}".format(endpoint)
-    req_snapchat = s.get(url_snapchat, verify=False)
-    if req_snapchat.status_code not in [404, 403, 401]:
-        soup = BeautifulSoup(req_snapchat.text, "html.parser")
+    try:
+        req_snapchat = SESSION.get(url_snapchat, verify=False, timeout=TIMEOUT)
+    except requests.RequestException:
+        # Timeout, connection or redirect error, this username is skipped and the worker goes on
+        return
+    if req_snapchat.status_code not in SKIP_STATUSES:
+        soup = BeautifulSoup(page_head(req_snapchat.content, b"UserDetailsCard_title"), "lxml")
         try:
-            find_name = soup.find('span', {'class': re.compile(r'UserDetailsCard_title*')})
-            print(" \033[32m+ {}\033[0m snapchat username seem exit with real name {} on https://www.snapchat.com/add/{}".format(endpoint, "\033[32m{}\033[0m".format(find_name.text if find_name.text else "\033[31mNone\033[0m"), endpoint))
+            find_name = soup.find('span', {'class': NAME_RE})
+            name = find_name.text
+            print(" \033[32m+ {}\033[0m snapchat username seem exit with real name {} on https://www.snapchat.com/add/{}".format(endpoint, "\033[32m{}\033[0m".format(name if name else "\033[31mNone\033[0m"), endpoint))
         except AttributeError:
             print(" \033[32m+ {}\033[0m snapchat username seem exit with real name \033[31mNone\033[0m".format(endpoint))
 
 
+def snapchat_worker(q):
+    # Every username is queued before the workers start, so an empty queue means the work is done
+    while True:
+        try:
+            endpoint = q.get_nowait()
+        except Empty:
+            return
+        try:
+            get_snapchat(endpoint)
+            sys.stdout.write(" \033[34musername: {}\033[0m\r".format(endpoint))
+            sys.stdout.write("\033[K")
+        except Exception:
+            # Report the error and keep draining the queue, a dead worker would leave join() waiting
+            traceback.print_exc()
+        finally:
+            q.task_done()
+
+
 def parse_snapchat_username(identity, pseudo, city, keyword):
 
     print("\033[36m Snapchat search\033[0m")
-    s = requests.session()
-
     endpoints = []
 
+    if city and (pseudo or identity):
+        # Start the slow geofree lookup now, the other usernames are built in the meantime
+        executor = ThreadPoolExecutor(max_workers=1)
+        postal_code_lookup = executor.submit(get_postal_code, city)
+        executor.shutdown(wait=False)
+
     if pseudo and not identity and not city and not keyword:
-        get_snapchat(pseudo, s)
+        get_snapchat(pseudo)
     else:
         if pseudo:
             endpoints.append(pseudo)
@@ -65,53 +148,25 @@ def parse_snapchat_username(identity, pseudo, city, keyword):
             for li in list_identity:
                 endpoints.append(li)
         if city and pseudo:
-            postal_code = get_postal_code(city)
-            list_city = [
-            "{}{}".format(pseudo, city), "{}{}".format(city, pseudo), "{}_{}".format(pseudo, city), "{}.{}".format(pseudo, city),
-            "{}_de{}".format(pseudo, city), "{}_of{}".format(pseudo, city), 
-            "{}-de{}".format(pseudo, city), "{}-of{}".format(pseudo, city),
-            "{}{}".format(pseudo, postal_code), "{}{}".format(postal_code, pseudo), "{}_{}".format(pseudo, postal_code), 
-            "{}_du{}".format(pseudo, postal_code), "{}_of{}".format(pseudo, postal_code), 
-            "{}-du{}".format(pseudo, postal_code), "{}-of{}".format(pseudo, postal_code) 
-            ]
-            for lc in list_city:
-                endpoints.append(lc)
+            postal_code = postal_code_lookup.result()
+            endpoints.extend([pattern.format(e=pseudo, c=city, z=postal_code) for pattern in CITY_PATTERNS])
         elif city and identity:
-            city_identity = []
-            postal_code = get_postal_code(city)
-            for e in endpoints:
-                list_city_identity = [
-                "{}{}".format(e, city), "{}{}".format(city, e), "{}_{}".format(e, city), "{}.{}".format(e, city),
-                "{}_de{}".format(e, city), "{}_of{}".format(e, city), 
-                "{}-de{}".format(e, city), "{}-of{}".format(e, city),
-                "{}{}".format(e, postal_code), "{}{}".format(postal_code, e), "{}_{}".format(e, postal_code), 
-                "{}_du{}".format(e, postal_code), "{}_of{}".format(e, postal_code), 
-                "{}-du{}".format(e, postal_code), "{}-of{}".format(e, postal_code) ]
-                for lci in list_city_identity:
-                    city_identity.append(lci)
-            for ci in city_identity:
-                endpoints.append(ci)
+            postal_code = postal_code_lookup.result()
+            endpoints.extend([pattern.format(e=e, c=city, z=postal_code) for e in endpoints for pattern in CITY_PATTERNS])
         if keyword and pseudo:
-            list_keyword = [
-            "{}{}".format(pseudo, keyword), "{}{}".format(keyword, pseudo), 
-            "{}_{}".format(pseudo, keyword), "{}-{}".format(pseudo, keyword), "{}.{}".format(pseudo, keyword)]
-            for lk in list_keyword:
-                endpoints.append(lk)
+            endpoints.extend([pattern.format(e=pseudo, k=keyword) for pattern in KEYWORD_PATTERNS])
         elif keyword and identity:
-            keyword_identity = []
-            for e in endpoints:
-                list_keyword_identity = [
-                "{}{}".format(e, keyword), "{}{}".format(keyword, e), "{}_{}".format(e, keyword), "{}.{}".format(e, keyword),
-                "{}_de{}".format(e, keyword), "{}_of{}".format(e, keyword), 
-                "{}-de{}".format(e, keyword), "{}-of{}".format(e, keyword)]
-                for lki in list_keyword_identity:
-                    keyword_identity.append(lki)
-            for ki in keyword_identity:
-                endpoints.append(ki)
+            endpoints.extend([pattern.format(e=e, k=keyword) for e in endpoints for pattern in KEYWORD_IDENTITY_PATTERNS])
+        # Several patterns can give the same username, check each one only once
+        endpoints = list(dict.fromkeys(endpoints))
+        # Every username is independent, check them with a pool of workers instead of one after the other
+        endpoints_queue = Queue()
         for endpoint in endpoints:
-            get_snapchat(endpoint, s)
-            sys.stdout.write(" \033[34musername: {}\033[0m\r".format(endpoint))
-            sys.stdout.write("\033[K")
+            endpoints_queue.put(endpoint)
+        for i in range(min(threads, len(endpoints))):
+            worker = Thread(target=snapchat_worker, args=(endpoints_queue,), daemon=True)
+            worker.start()
+        endpoints_queue.join()
 
 
 
@@ -127,9 +182,13 @@ if __name__ == '__main__':
     group = parser.add_argument_group('\033[34m> Assistance\033[0m')
     group.add_argument("-c", help="City adress, exemple: -c Paris", dest='city', required=False)
     group.add_argument("-k", help="Keyword, the script will be based on this, exemple: -k security; -k pro", dest='keyword', required=False)
+    group.add_argument("-t", help="Number of threads, default: 20", dest='thread', type=int, default=20, required=False)
 
     results = parser.parse_args()
 
+    if results.thread < 1:
+        parser.error("-t needs at least 1 thread")
+
     if len(sys.argv) < 2:
         print("\nOption missing\n")
         parser.print_help()
@@ -139,5 +198,6 @@ if __name__ == '__main__':
     pseudo = results.pseudo
     city = results.city
     keyword = results.keyword
+    threads = results.thread
 
     parse_snapchat_username(identity, pseudo, city, keyword)
\ No newline at end of file